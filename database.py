@@ -6,8 +6,11 @@ import os
 import time
 import re
 import socket
+import atexit
+import threading
+from pathlib import Path
 from typing import Optional
-from elasticsearch import Elasticsearch
+from elasticsearch import Elasticsearch, helpers
 
 DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "file_guessr.db")
 ES_INDEX = "file_guessr"
@@ -151,15 +154,11 @@ def _ensure_index():
     print(f"[ES] Created index '{ES_INDEX}'")
 
 
-def _index_to_es(file_path: str, file_name: str, file_type: str,
-                 file_size: int, modified_time: float,
-                 summary: str, keywords: str, raw_text: str):
-    """Index a document into Elasticsearch."""
-    es = _get_es()
-    if es is None:
-        return
-
-    doc = {
+def _es_doc(file_path: str, file_name: str, file_type: str,
+            file_size: int, modified_time: float,
+            summary: str, keywords: str, raw_text: str) -> dict:
+    """Build the Elasticsearch document for a file."""
+    return {
         "file_name": file_name,
         "summary": summary,
         "keywords": keywords,
@@ -169,11 +168,37 @@ def _index_to_es(file_path: str, file_name: str, file_type: str,
         "file_size": file_size,
         "modified_time": modified_time,
     }
+
+
+def _index_to_es(file_path: str, file_name: str, file_type: str,
+                 file_size: int, modified_time: float,
+                 summary: str, keywords: str, raw_text: str):
+    """Index a document into Elasticsearch."""
+    es = _get_es()
+    if es is None:
+        return
+
+    doc = _es_doc(file_path, file_name, file_type, file_size,
+                  modified_time, summary, keywords, raw_text)
     # Use file_path as the document ID for easy upsert
     doc_id = _path_to_id(file_path)
     es.index(index=ES_INDEX, id=doc_id, document=doc)
 
 
+def _bulk_index_to_es(rows: list[tuple]):
+    """Index many documents into Elasticsearch with one bulk request."""
+    es = _get_es()
+    if es is None:
+        return
+
+    # Rows may carry a trailing indexed_at, which isn't part of the ES document
+    actions = [
+        {"_index": ES_INDEX, "_id": _path_to_id(row[0]), "_source": _es_doc(*row[:8])}
+        for row in rows
+    ]
+    helpers.bulk(es, actions)
+
+
 def _delete_from_es(file_path: str):
     """Delete a document from Elasticsearch."""
     es = _get_es()
@@ -186,11 +211,15 @@ def _delete_from_es(file_path: str):
         pass  # Ignore if not found
 
 
+# Characters not allowed in ES document IDs (compiled once; used for every indexed file)
+_ES_ID_UNSAFE_RE = re.compile(r'[^a-zA-Z0-9_.\-]')
+
+
 def _path_to_id(file_path: str) -> str:
     """Convert a file path to an ES-safe document ID."""
     # Normalize first, then replace special chars
     normalized = _normalize_path(file_path)
-    return re.sub(r'[^a-zA-Z0-9_.\-]', '_', normalized)
+    return _ES_ID_UNSAFE_RE.sub('_', normalized)
 
 
 def _normalize_path(path: str) -> str:
@@ -203,14 +232,89 @@ def _normalize_path(path: str) -> str:
 
 # ──────────────── SQLite ────────────────
 
+# Writes go through one cached connection per thread (see get_connection).
+# Re-opening the DB (plus its WAL/SHM files) on every helper call dominated
+# I/O during bulk indexing. Reads go through a single shared read-only
+# connection (see _query), so web requests never touch a writer connection.
+_local = threading.local()
+_all_conns: list[sqlite3.Connection] = []
+_all_conns_lock = threading.Lock()
+
+_reader: Optional[sqlite3.Connection] = None
+_reader_lock = threading.Lock()
+
+# Bumped after every change to the indexed files, so callers can cache
+# search results and drop them as soon as the index changes.
+_index_version = 0
+_index_changed_at = 0.0
+_index_version_lock = threading.Lock()
+
+# Bumped by clear_db(). A batch of rows gathered before a clear must not be
+# written after it, so clear_db() and generation-checked bulk writes share a lock.
+_clear_generation = 0
+_clear_lock = threading.Lock()
+
+
 def get_connection() -> sqlite3.Connection:
+    """Get this thread's cached read-write SQLite connection (lazily opened)."""
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        return conn
+
     conn = sqlite3.connect(DB_PATH)
     conn.row_factory = sqlite3.Row
+    # Only takes effect on a brand-new DB, and must come before switching to WAL
+    conn.execute("PRAGMA page_size=8192")
     # Enable WAL mode for better concurrency (multiple readers + 1 writer)
     conn.execute("PRAGMA journal_mode=WAL")
+    # Safe under WAL: no fsync per commit, only at checkpoints
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-65536")  # 64MB
+    conn.execute("PRAGMA mmap_size=268435456")  # 256MB
+    conn.execute("PRAGMA wal_autocheckpoint=1000")  # pages
+
+    _local.conn = conn
+    with _all_conns_lock:
+        _all_conns.append(conn)
     return conn
 
 
+def _get_reader() -> sqlite3.Connection:
+    """Get the shared read-only connection (lazily opened). Call with _reader_lock held."""
+    global _reader
+    if _reader is None:
+        uri = Path(DB_PATH).as_uri() + "?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA cache_size=-65536")  # 64MB
+        conn.execute("PRAGMA mmap_size=268435456")  # 256MB
+        _reader = conn
+        with _all_conns_lock:
+            _all_conns.append(conn)
+    return _reader
+
+
+def _query(sql: str, params=()) -> list[sqlite3.Row]:
+    """Run a read-only query on the shared reader connection."""
+    with _reader_lock:
+        return _get_reader().execute(sql, params).fetchall()
+
+
+def _close_connections():
+    """Close every cached connection (registered with atexit)."""
+    with _all_conns_lock:
+        for conn in _all_conns:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        _all_conns.clear()
+
+
+atexit.register(_close_connections)
+
+
 def init_db():
     """Create SQLite tables and ensure ES index exists."""
     conn = get_connection()
@@ -231,6 +335,11 @@ def init_db():
             indexed_at REAL
         )
     """)
+    # file_path is UNIQUE (already indexed). These back get_stats' GROUP BY
+    # and the ORDER BY ... LIMIT of the SQLite fallback search.
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_files_type ON files(file_type)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_files_indexed_at ON files(indexed_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_files_modified_time ON files(modified_time)")
 
     # Store monitored folders
     cursor.execute("""
@@ -252,7 +361,6 @@ def init_db():
     cursor.execute("INSERT OR IGNORE INTO settings (key, value) VALUES ('llm_model', 'gemma3:4b')")
 
     conn.commit()
-    conn.close()
 
     # Initialize Elasticsearch index (defensively)
     try:
@@ -263,24 +371,55 @@ def init_db():
 
 # ──────────────── CRUD ────────────────
 
+def _bump_index_version():
+    global _index_version, _index_changed_at
+    # Writers run on several threads (to_thread, watcher); += alone can lose a bump
+    with _index_version_lock:
+        _index_version += 1
+        _index_changed_at = time.monotonic()
+
+
+def get_index_version() -> tuple[int, float]:
+    """Return (version, monotonic time of the last change) of the file index."""
+    return _index_version, _index_changed_at
+
+
+def get_clear_generation() -> int:
+    """Return how many times the index has been cleared (see upsert_files_bulk)."""
+    return _clear_generation
+
+
 def get_setting(key: str, default: str = "") -> str:
     """Get a setting value from SQLite."""
-    conn = get_connection()
-    row = conn.execute("SELECT value FROM settings WHERE key = ?", (key,)).fetchone()
-    conn.close()
-    return row["value"] if row else default
+    rows = _query("SELECT value FROM settings WHERE key = ?", (key,))
+    return rows[0]["value"] if rows else default
 
 
 def set_setting(key: str, value: str):
     """Set a setting value in SQLite."""
     conn = get_connection()
-    conn.execute("""
-        INSERT INTO settings (key, value)
-        VALUES (?, ?)
-        ON CONFLICT(key) DO UPDATE SET value=excluded.value
-    """, (key, value))
-    conn.commit()
-    conn.close()
+    with conn:
+        conn.execute("""
+            INSERT INTO settings (key, value)
+            VALUES (?, ?)
+            ON CONFLICT(key) DO UPDATE SET value=excluded.value
+        """, (key, value))
+
+
+_UPSERT_SQL = """
+    INSERT INTO files (file_path, file_name, file_type, file_size, modified_time,
+                       summary, keywords, raw_text, indexed_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(file_path) DO UPDATE SET
+        file_name=excluded.file_name,
+        file_type=excluded.file_type,
+        file_size=excluded.file_size,
+        modified_time=excluded.modified_time,
+        summary=excluded.summary,
+        keywords=excluded.keywords,
+        raw_text=excluded.raw_text,
+        indexed_at=excluded.indexed_at
+"""
 
 
 def upsert_file(file_path: str, file_name: str, file_type: str,
@@ -291,23 +430,9 @@ def upsert_file(file_path: str, file_name: str, file_type: str,
     ai_logger.info(f"[DB] Upserting {file_name}: keywords={len(keywords)}, summary={len(summary)}")
     file_path = _normalize_path(file_path)
     conn = get_connection()
-    conn.execute("""
-        INSERT INTO files (file_path, file_name, file_type, file_size, modified_time,
-                           summary, keywords, raw_text, indexed_at)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ON CONFLICT(file_path) DO UPDATE SET
-            file_name=excluded.file_name,
-            file_type=excluded.file_type,
-            file_size=excluded.file_size,
-            modified_time=excluded.modified_time,
-            summary=excluded.summary,
-            keywords=excluded.keywords,
-            raw_text=excluded.raw_text,
-            indexed_at=excluded.indexed_at
-    """, (file_path, file_name, file_type, file_size, modified_time,
-          summary, keywords, raw_text, time.time()))
-    conn.commit()
-    conn.close()
+    with conn:
+        conn.execute(_UPSERT_SQL, (file_path, file_name, file_type, file_size, modified_time,
+                                   summary, keywords, raw_text, time.time()))
 
     # Also index into Elasticsearch
     try:
@@ -315,23 +440,70 @@ def upsert_file(file_path: str, file_name: str, file_type: str,
                      modified_time, summary, keywords, raw_text)
     except Exception as e:
         print(f"[ES] Warning: Failed to index {file_name}: {e}")
+    _bump_index_version()
+
+
+def upsert_files_bulk(rows: list[tuple], clear_generation: Optional[int] = None) -> bool:
+    """
+    Insert or update many file records in a single transaction.
+    Each row is (file_path, file_name, file_type, file_size, modified_time,
+    summary, keywords, raw_text) - the same order as upsert_file().
+
+    If `clear_generation` (from get_clear_generation()) is given and clear_db()
+    has run since, the rows are stale and dropped; returns False in that case.
+    """
+    if not rows:
+        return True
+    if clear_generation is None:
+        _upsert_files_bulk(rows)
+        return True
+    with _clear_lock:
+        if _clear_generation != clear_generation:
+            print(f"[DB] Index was cleared, dropping {len(rows)} buffered files")
+            return False
+        _upsert_files_bulk(rows)
+    return True
+
+
+def _upsert_files_bulk(rows: list[tuple]):
+    from llm import ai_logger
+    ai_logger.info(f"[DB] Bulk upserting {len(rows)} files")
+    now = time.time()
+    rows = [(_normalize_path(row[0]), *row[1:], now) for row in rows]
+    conn = get_connection()
+    with conn:
+        conn.executemany(_UPSERT_SQL, rows)
+
+    # Also index into Elasticsearch
+    try:
+        _bulk_index_to_es(rows)
+    except Exception as e:
+        print(f"[ES] Warning: Failed to bulk index {len(rows)} files: {e}")
+    _bump_index_version()
 
 
-def search(query: str, limit: int = 20) -> list[dict]:
+def search(query: str, limit: int = 20) -> tuple[list[dict], bool]:
     """
     Search files using Elasticsearch multi_match with fuzziness.
     Falls back to SQLite LIKE if ES is unavailable.
+
+    Returns (results, degraded). `degraded` is True when the ES query failed
+    or the SQLite fallback was used, so callers know not to cache the results.
     """
     es = _get_es()
     if es is not None:
-        return _search_es(query, limit)
+        try:
+            return _search_es(query, limit), False
+        except Exception as e:
+            print(f"[ES] Search error: {e}")
+            return [], True
     else:
         print("[Search] ES unavailable, falling back to SQLite LIKE search")
-        return _search_sqlite_fallback(query, limit)
+        return _search_sqlite_fallback(query, limit), True
 
 
 def _search_es(query: str, limit: int = 20) -> list[dict]:
-    """Search using Elasticsearch multi_match + fuzzy."""
+    """Search using Elasticsearch multi_match + fuzzy. Raises on ES errors."""
     es = _get_es()
     if es is None:
         return []
@@ -409,35 +581,31 @@ def _search_es(query: str, limit: int = 20) -> list[dict]:
                          "summary", "keywords", "modified_time"],
         }
 
-    try:
-        resp = es.search(index=ES_INDEX, body=body)
-        results = []
-        for hit in resp["hits"]["hits"]:
-            src = hit["_source"]
-            src["relevance"] = hit["_score"]
-            results.append(src)
-        return results
-    except Exception as e:
-        print(f"[ES] Search error: {e}")
-        return []
+    resp = es.search(index=ES_INDEX, body=body)
+    results = []
+    for hit in resp["hits"]["hits"]:
+        src = hit["_source"]
+        src["relevance"] = hit["_score"]
+        results.append(src)
+    return results
 
 
 def _search_sqlite_fallback(query: str, limit: int = 20) -> list[dict]:
     """Fallback: simple SQLite LIKE search when ES is unavailable."""
-    conn = get_connection()
     if not query:
         # Empty query: return most recent files
-        rows = conn.execute(f"""
+        rows = _query(f"""
             SELECT file_path, file_name, file_type, file_size,
                    summary, keywords, modified_time
             FROM files
             ORDER BY indexed_at DESC
             LIMIT ?
-        """, [limit]).fetchall()
+        """, [limit])
     else:
-        terms = query.split()
+        # LLM-expanded queries often repeat words; a repeated term would only
+        # add redundant LIKE scans
+        terms = list(dict.fromkeys(query.split()))
         if not terms:
-            conn.close()
             return []
 
         # Build LIKE conditions for each term
@@ -451,40 +619,40 @@ def _search_sqlite_fallback(query: str, limit: int = 20) -> list[dict]:
             params.extend([like, like, like])
 
         where_clause = " OR ".join(conditions)
-        rows = conn.execute(f"""
+        rows = _query(f"""
             SELECT file_path, file_name, file_type, file_size,
                    summary, keywords, modified_time
             FROM files
             WHERE {where_clause}
             ORDER BY modified_time DESC
             LIMIT ?
-        """, params + [limit]).fetchall()
+        """, params + [limit])
 
-    conn.close()
     return [dict(row) for row in rows]
 
 
 def get_file_modified_time(file_path: str) -> Optional[float]:
     """Get the stored modified_time for a file, or None if not indexed."""
     file_path = _normalize_path(file_path)
-    conn = get_connection()
-    row = conn.execute(
+    rows = _query(
         "SELECT modified_time FROM files WHERE file_path = ?", (file_path,)
-    ).fetchone()
-    conn.close()
-    return row["modified_time"] if row else None
+    )
+    return rows[0]["modified_time"] if rows else None
+
+
+def get_all_modified_times() -> dict[str, float]:
+    """Get {file_path: modified_time} for every indexed file in one query."""
+    rows = _query("SELECT file_path, modified_time FROM files")
+    return {row["file_path"]: row["modified_time"] for row in rows}
 
 
 def get_stats() -> dict:
     """Get indexing statistics."""
-    conn = get_connection()
-    total = conn.execute("SELECT COUNT(*) as c FROM files").fetchone()["c"]
+    total = _query("SELECT COUNT(*) as c FROM files")[0]["c"]
 
-    type_counts = conn.execute(
+    type_counts = _query(
         "SELECT file_type, COUNT(*) as c FROM files GROUP BY file_type ORDER BY c DESC"
-    ).fetchall()
-
-    conn.close()
+    )
 
     # Also show ES status
     es = _get_es()
@@ -500,39 +668,39 @@ def get_stats() -> dict:
 
 def clear_db():
     """Clear all indexed data from both SQLite and ES."""
-    conn = get_connection()
-    conn.execute("DELETE FROM files")
-    conn.execute("DELETE FROM watched_folders")
-    conn.commit()
-    conn.close()
-
-    # Clear ES index
-    es = _get_es()
-    if es is not None:
-        try:
-            es.indices.delete(index=ES_INDEX)
-            _ensure_index()  # Recreate empty index
-        except Exception as e:
-            print(f"[ES] Warning: Failed to clear index: {e}")
+    global _clear_generation
+    with _clear_lock:
+        _clear_generation += 1
+        conn = get_connection()
+        with conn:
+            conn.execute("DELETE FROM files")
+            conn.execute("DELETE FROM watched_folders")
+
+        # Clear ES index
+        es = _get_es()
+        if es is not None:
+            try:
+                es.indices.delete(index=ES_INDEX)
+                _ensure_index()  # Recreate empty index
+            except Exception as e:
+                print(f"[ES] Warning: Failed to clear index: {e}")
+    _bump_index_version()
 
 
 def add_watched_folder(folder_path: str):
     """Add a folder to watch list."""
     folder_path = _normalize_path(folder_path)
     conn = get_connection()
-    conn.execute(
-        "INSERT OR IGNORE INTO watched_folders (folder_path, added_at) VALUES (?, ?)",
-        (folder_path, time.time())
-    )
-    conn.commit()
-    conn.close()
+    with conn:
+        conn.execute(
+            "INSERT OR IGNORE INTO watched_folders (folder_path, added_at) VALUES (?, ?)",
+            (folder_path, time.time())
+        )
 
 
 def get_watched_folders() -> list[str]:
     """Get all watched folders."""
-    conn = get_connection()
-    rows = conn.execute("SELECT folder_path FROM watched_folders").fetchall()
-    conn.close()
+    rows = _query("SELECT folder_path FROM watched_folders")
     return [row["folder_path"] for row in rows]
 
 
@@ -540,12 +708,11 @@ def remove_watched_folder(folder_path: str):
     """Remove a folder from watch list and its indexed files."""
     folder_path = _normalize_path(folder_path)
     conn = get_connection()
-    # Remove folder from watch list
-    conn.execute("DELETE FROM watched_folders WHERE folder_path = ?", (folder_path,))
-    # Remove all files under this folder
-    conn.execute("DELETE FROM files WHERE file_path LIKE ?", (folder_path + "%",))
-    conn.commit()
-    conn.close()
+    with conn:
+        # Remove folder from watch list
+        conn.execute("DELETE FROM watched_folders WHERE folder_path = ?", (folder_path,))
+        # Remove all files under this folder
+        conn.execute("DELETE FROM files WHERE file_path LIKE ?", (folder_path + "%",))
 
     # Also remove from ES
     es = _get_es()
@@ -556,14 +723,15 @@ def remove_watched_folder(folder_path: str):
             }, refresh=True)
         except Exception as e:
             print(f"[ES] Warning: Failed to remove folder files: {e}")
+    _bump_index_version()
 
 
 def remove_file(file_path: str):
     """Remove a file from both SQLite and ES index."""
     file_path = _normalize_path(file_path)
     conn = get_connection()
-    conn.execute("DELETE FROM files WHERE file_path = ?", (file_path,))
-    conn.commit()
-    conn.close()
+    with conn:
+        conn.execute("DELETE FROM files WHERE file_path = ?", (file_path,))
 
     _delete_from_es(file_path)
+    _bump_index_version()
@@ -2,13 +2,60 @@
 File parser - Extract text content and embedded images from various file types.
 """
 import os
+import codecs
 import tempfile
-import chardet
+from itertools import islice
+from charset_normalizer import from_bytes
 from typing import Optional
 
+# Document libraries are imported once here (not inside each parse call).
+# A missing library just disables that format.
+try:
+    from pypdf import PdfReader
+except ImportError:
+    PdfReader = None
+
+try:
+    from docx import Document
+except ImportError:
+    Document = None
+
+try:
+    from openpyxl import load_workbook
+except ImportError:
+    load_workbook = None
+
+try:
+    from pptx import Presentation
+    from pptx.enum.shapes import MSO_SHAPE_TYPE
+except ImportError:
+    Presentation = None
+    MSO_SHAPE_TYPE = None
+
 # Max characters to extract from a file
 MAX_TEXT_LENGTH = 4000
 
+# Hard caps on how much of a document is walked, on top of MAX_TEXT_LENGTH
+# (a sheet of empty-ish rows or a deck of image-only slides never fills it)
+XLSX_MAX_ROWS = 200  # per sheet
+PPTX_MAX_SLIDES = 20
+DOCX_MAX_PARAGRAPHS = 500
+
+# Bytes read from a text file: enough for MAX_TEXT_LENGTH chars at 4 bytes/char (UTF-8 worst case)
+TEXT_READ_BYTES = min(MAX_TEXT_LENGTH * 4, 16384)
+
+# Bytes handed to the charset detector; accuracy plateaus well before this
+SNIFF_BYTES = 8192
+
+# Byte-order marks checked before any detection (UTF-32 before UTF-16: same prefix)
+_BOMS = (
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+)
+
 # File extensions by category
 TEXT_EXTENSIONS = {
     ".txt", ".md", ".csv", ".json", ".xml", ".log", ".ini", ".yaml", ".yml",
@@ -33,19 +80,42 @@ DOCUMENT_EXTENSIONS = {
 }
 
 
-def get_file_category(file_path: str) -> str:
-    """Determine the file category based on extension."""
-    ext = os.path.splitext(file_path)[1].lower()
+# Archives, executables, media, disk images... never worth opening as text
+BINARY_SKIP_EXTENSIONS = {
+    ".zip", ".tar", ".gz", ".tgz", ".bz2", ".xz", ".7z", ".rar", ".cab",
+    ".exe", ".dll", ".so", ".dylib", ".msi", ".sys", ".lib", ".a", ".o", ".obj",
+    ".class", ".jar", ".pyc", ".pyd", ".whl", ".apk",
+    ".mp4", ".mkv", ".avi", ".mov", ".wmv", ".flv", ".webm", ".m4v",
+    ".mp3", ".flac", ".wav", ".aac", ".ogg", ".m4a", ".wma",
+    ".iso", ".img", ".vhd", ".vhdx", ".vmdk", ".dmg",
+    ".bin", ".dat", ".db", ".sqlite", ".mdb", ".pak",
+    ".ttf", ".otf", ".woff", ".woff2",
+    ".psd", ".ai", ".raw", ".cr2", ".nef",
+}
+
+# Extension -> category, merged once at import so lookup is a single dict hit
+EXT_TO_CATEGORY = {
+    **{ext: "document" for ext in DOCUMENT_EXTENSIONS},
+    **{ext: "code" for ext in CODE_EXTENSIONS},
+    **{ext: "text" for ext in TEXT_EXTENSIONS},
+    **{ext: "image" for ext in IMAGE_EXTENSIONS},
+}
+
+
+def get_file_ext(file_path: str) -> str:
+    """Lower-cased extension of a path (e.g. ".txt"), like os.path.splitext but cheaper."""
+    name = os.path.basename(file_path)
+    dot = name.rfind(".")
+    # Leading dots don't start an extension (".env" has none), as in os.path.splitext
+    leading_dots = len(name) - len(name.lstrip("."))
+    return name[dot:].lower() if dot >= leading_dots else ""
+
 
-    if ext in IMAGE_EXTENSIONS:
-        return "image"
-    if ext in TEXT_EXTENSIONS:
-        return "text"
-    if ext in CODE_EXTENSIONS:
-        return "code"
-    if ext in DOCUMENT_EXTENSIONS:
-        return "document"
-    return "unknown"
+def get_file_category(file_path: str, ext: Optional[str] = None) -> str:
+    """Determine the file category based on extension (pass `ext` if already known)."""
+    if ext is None:
+        ext = get_file_ext(file_path)
+    return EXT_TO_CATEGORY.get(ext, "unknown")
 
 
 def parse_file(file_path: str) -> tuple[Optional[str], str]:
@@ -53,7 +123,8 @@ def parse_file(file_path: str) -> tuple[Optional[str], str]:
     Parse a file and return (text_content, category).
     For images, text_content is None (handled by vision model).
     """
-    category = get_file_category(file_path)
+    ext = get_file_ext(file_path)
+    category = get_file_category(file_path, ext)
 
     if category == "image":
         return None, "image"
@@ -62,7 +133,7 @@ def parse_file(file_path: str) -> tuple[Optional[str], str]:
         if category in ("text", "code"):
             return _read_text_file(file_path), category
         elif category == "document":
-            return _parse_document(file_path), category
+            return _parse_document(file_path, ext), category
         else:
             # Unknown: try to read as text
             return _read_text_file(file_path), "text"
@@ -75,27 +146,55 @@ def _read_text_file(file_path: str) -> Optional[str]:
     """Read a text file with encoding detection."""
     try:
         with open(file_path, "rb") as f:
-            raw = f.read(100000)  # Read up to 100KB for detection
+            raw = f.read(TEXT_READ_BYTES)
 
         if not raw:
             return None
 
-        detected = chardet.detect(raw)
-        encoding = detected.get("encoding", "utf-8") or "utf-8"
-
-        try:
-            text = raw.decode(encoding)
-        except (UnicodeDecodeError, LookupError):
-            text = raw.decode("utf-8", errors="replace")
-
+        text = _decode_text(raw, truncated=len(raw) == TEXT_READ_BYTES)
         return text[:MAX_TEXT_LENGTH] if text.strip() else None
     except Exception:
         return None
 
 
-def _parse_document(file_path: str) -> Optional[str]:
+def _decode_text(raw: bytes, truncated: bool = False) -> str:
+    """
+    Decode bytes, trying the cheap cases first: BOM, then plain UTF-8 (which
+    covers ASCII). Only if both fail is the charset detector run, on at most
+    SNIFF_BYTES of the input. Pass truncated=True when `raw` is only the start
+    of the file.
+    """
+    for bom, encoding in _BOMS:
+        if raw.startswith(bom):
+            return raw.decode(encoding, errors="replace")
+
+    try:
+        # A partial read may end halfway through a multi-byte character; with
+        # final=False the decoder holds back that incomplete tail instead of failing
+        return codecs.getincrementaldecoder("utf-8")().decode(raw, final=not truncated)
+    except UnicodeDecodeError:
+        pass
+
+    # BOMs were handled above; a BOM-less UTF-16/32 guess is almost always a
+    # misreading of short 8-bit text
+    matches = [m for m in from_bytes(raw[:SNIFF_BYTES])
+               if not m.encoding.startswith(("utf_16", "utf_32"))]
+    encoding = matches[0].encoding if matches else "utf-8"
+    # Short samples often fit many code pages equally well; among those, prefer
+    # cp1252, the usual legacy encoding of Western text on Windows
+    if any("cp1252" in m.could_be_from_charset
+           for m in matches if m.chaos <= matches[0].chaos):
+        encoding = "cp1252"
+    try:
+        return raw.decode(encoding)
+    except (UnicodeDecodeError, LookupError):
+        return raw.decode("utf-8", errors="replace")
+
+
+def _parse_document(file_path: str, ext: Optional[str] = None) -> Optional[str]:
     """Parse document files (PDF, DOCX, XLSX, PPTX) - text extraction only."""
-    ext = os.path.splitext(file_path)[1].lower()
+    if ext is None:
+        ext = get_file_ext(file_path)
 
     try:
         if ext == ".pdf":
@@ -113,15 +212,20 @@ def _parse_document(file_path: str) -> Optional[str]:
 
 def _parse_pdf(file_path: str) -> Optional[str]:
     """Extract text from PDF using pypdf."""
-    import pypdf
+    if PdfReader is None:
+        return None
 
     text_parts = []
+    total_len = 0
     try:
-        reader = pypdf.PdfReader(file_path)
+        reader = PdfReader(file_path)
         for page in reader.pages:
             text = page.extract_text()
             if text:
                 text_parts.append(text)
+                total_len += len(text) + 1
+                if total_len >= MAX_TEXT_LENGTH:
+                    break  # Enough text; skip the remaining pages
     except Exception as e:
         print(f"[Parser] PDF error: {e}")
         return None
@@ -132,28 +236,46 @@ def _parse_pdf(file_path: str) -> Optional[str]:
 
 def _parse_docx(file_path: str) -> Optional[str]:
     """Extract text from DOCX."""
-    from docx import Document
+    if Document is None:
+        return None
 
     doc = Document(file_path)
-    text_parts = [para.text for para in doc.paragraphs if para.text.strip()]
+    text_parts = []
+    total_len = 0
+    for para in islice(doc.paragraphs, DOCX_MAX_PARAGRAPHS):
+        para_text = para.text
+        if para_text.strip():
+            text_parts.append(para_text)
+            total_len += len(para_text) + 1
+            if total_len >= MAX_TEXT_LENGTH:
+                break
     text = "\n".join(text_parts)
     return text[:MAX_TEXT_LENGTH] if text.strip() else None
 
 
 def _parse_xlsx(file_path: str) -> Optional[str]:
     """Extract text from XLSX."""
-    from openpyxl import load_workbook
+    if load_workbook is None:
+        return None
 
     wb = load_workbook(file_path, read_only=True, data_only=True)
     text_parts = []
-    for sheet in wb.sheetnames:
-        ws = wb[sheet]
-        text_parts.append(f"[Sheet: {sheet}]")
-        for row in ws.iter_rows(values_only=True):
-            values = [str(cell) for cell in row if cell is not None]
-            if values:
-                text_parts.append(" | ".join(values))
-    wb.close()
+    total_len = 0
+    try:
+        for ws in wb.worksheets:
+            if total_len >= MAX_TEXT_LENGTH:
+                break
+            text_parts.append(f"[Sheet: {ws.title}]")
+            for row in ws.iter_rows(values_only=True, max_row=XLSX_MAX_ROWS):
+                values = [str(cell) for cell in row if cell is not None]
+                if values:
+                    line = " | ".join(values)
+                    text_parts.append(line)
+                    total_len += len(line) + 1
+                    if total_len >= MAX_TEXT_LENGTH:
+                        break
+    finally:
+        wb.close()
 
     text = "\n".join(text_parts)
     return text[:MAX_TEXT_LENGTH] if text.strip() else None
@@ -161,17 +283,23 @@ def _parse_xlsx(file_path: str) -> Optional[str]:
 
 def _parse_pptx(file_path: str) -> Optional[str]:
     """Extract text from PPTX."""
-    from pptx import Presentation
+    if Presentation is None:
+        return None
 
     prs = Presentation(file_path)
     text_parts = []
-    for slide_num, slide in enumerate(prs.slides, 1):
+    total_len = 0
+    for slide_num, slide in enumerate(islice(prs.slides, PPTX_MAX_SLIDES), 1):
+        if total_len >= MAX_TEXT_LENGTH:
+            break
         text_parts.append(f"[Slide {slide_num}]")
         for shape in slide.shapes:
             if shape.has_text_frame:
                 for para in shape.text_frame.paragraphs:
-                    if para.text.strip():
-                        text_parts.append(para.text)
+                    para_text = para.text
+                    if para_text.strip():
+                        text_parts.append(para_text)
+                        total_len += len(para_text) + 1
 
     text = "\n".join(text_parts)
     return text[:MAX_TEXT_LENGTH] if text.strip() else None
@@ -218,7 +346,8 @@ def get_docx_images(file_path: str) -> list[str]:
     Extract embedded images from a DOCX file.
     Returns list of temporary image file paths.
     """
-    from docx import Document
+    if Document is None:
+        return []
 
     image_paths = []
     try:
@@ -257,8 +386,8 @@ def get_pptx_images(file_path: str) -> list[str]:
     Extract embedded images from a PPTX file.
     Returns list of temporary image file paths.
     """
-    from pptx import Presentation
-    from pptx.enum.shapes import MSO_SHAPE_TYPE
+    if Presentation is None:
+        return []
 
     image_paths = []
     try:
@@ -291,7 +420,8 @@ def get_xlsx_images(file_path: str) -> list[str]:
     Extract embedded images from an XLSX file.
     Returns list of temporary image file paths.
     """
-    from openpyxl import load_workbook
+    if load_workbook is None:
+        return []
 
     image_paths = []
     try:
@@ -323,7 +453,7 @@ def get_document_images(file_path: str) -> list[str]:
     For DOCX/PPTX/XLSX: extracts embedded images.
     Returns list of temporary image file paths.
     """
-    ext = os.path.splitext(file_path)[1].lower()
+    ext = get_file_ext(file_path)
 
     if ext == ".pdf":
         return get_pdf_page_images(file_path)
@@ -4,15 +4,42 @@ Indexer - Scan folders, parse files, extract keywords via LLM, and store in data
 import os
 import time
 import asyncio
-from typing import Callable, Optional
-
-from file_parser import parse_file, get_file_category, get_document_images, cleanup_temp_images
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Callable, Iterator, Optional
+
+from file_parser import (
+    parse_file, get_file_ext, get_file_category, get_document_images, cleanup_temp_images,
+    BINARY_SKIP_EXTENSIONS,
+)
 from llm import extract_keywords, describe_image, ai_logger
-from database import upsert_file, get_file_modified_time, add_watched_folder
+from database import (
+    upsert_file, upsert_files_bulk, get_file_modified_time, get_all_modified_times,
+    add_watched_folder, get_clear_generation,
+)
 
 # Skip files larger than 50MB
 MAX_FILE_SIZE = 50 * 1024 * 1024
 
+# Indexed files are buffered and flushed to the DB in one transaction when the
+# batch is full or DB_FLUSH_INTERVAL has passed, whichever comes first. Each file
+# costs seconds of LLM time, so the time bound keeps new files searchable soon
+# and limits what a hard kill (which skips the final flush) can lose.
+DB_BATCH_SIZE = 100
+DB_FLUSH_INTERVAL = 5.0  # seconds
+
+# How many upcoming files to parse ahead while the LLM works on the current one
+PARSE_PREFETCH = 8
+
+# How far the folder walk may run ahead of indexing. Bounded so a huge tree
+# never sits in memory; total_files is a lower bound until the walk finishes.
+SCAN_QUEUE_SIZE = 1000
+
+# Parsing (charset detection, pypdf, openpyxl, docx...) runs here, off the event loop
+_parse_executor = ThreadPoolExecutor(max_workers=os.cpu_count() or 4,
+                                     thread_name_prefix="parser")
+
 # Skip these directories
 SKIP_DIRS = {
     "__pycache__", ".git", ".svn", "node_modules", ".venv", "venv",
@@ -26,31 +53,89 @@ indexing_state = {
     "folder": "",
     "total_files": 0,
     "processed_files": 0,
+    # True while the folder walk is still running, i.e. total_files may still grow
+    "scanning": False,
     "current_file": "",
     "errors": [],
     "start_time": 0,
 }
 
 
-def scan_folder(folder_path: str) -> list[str]:
-    """Recursively scan a folder and return all file paths."""
-    files = []
-    for root, dirs, filenames in os.walk(folder_path):
-        # Skip hidden/system directories
-        dirs[:] = [d for d in dirs if d not in SKIP_DIRS and not d.startswith(".")]
-
-        for filename in filenames:
-            if filename.startswith("."):
-                continue
-            file_path = os.path.join(root, filename)
+def scan_folder(folder_path: str) -> Iterator[tuple[str, int, float]]:
+    """
+    Recursively scan a folder, yielding (file_path, size, mtime) for each file.
+    Uses os.scandir so the stat info comes from the directory listing itself
+    instead of extra getsize/getmtime calls per file. Being a generator with an
+    explicit directory stack, memory stays O(depth) rather than O(files).
+    """
+    stack = [folder_path]
+    while stack:
+        dir_path = stack.pop()
+        try:
+            with os.scandir(dir_path) as it:
+                entries = list(it)
+        except OSError:
+            continue
+
+        subdirs = []
+        for entry in entries:
+            name = entry.name
             try:
-                size = os.path.getsize(file_path)
-                if size > MAX_FILE_SIZE or size == 0:
+                if entry.is_dir(follow_symlinks=False):
+                    # Skip hidden/system directories
+                    if name not in SKIP_DIRS and not name.startswith("."):
+                        subdirs.append(entry.path)
+                    continue
+                if name.startswith(".") or not entry.is_file():
+                    continue
+                # Skip archives/executables/media before paying for a stat or parse
+                if get_file_ext(name) in BINARY_SKIP_EXTENSIONS:
                     continue
-                files.append(file_path)
+                st = entry.stat()
             except OSError:
                 continue
-    return files
+            if st.st_size > MAX_FILE_SIZE or st.st_size == 0:
+                continue
+            yield entry.path, st.st_size, st.st_mtime
+
+        # Reversed so subdirectories are visited in listing order
+        stack.extend(reversed(subdirs))
+
+
+def _put_blocking(loop: asyncio.AbstractEventLoop, queue: asyncio.Queue,
+                  item, stop: threading.Event) -> bool:
+    """Put `item` on a bounded loop-side queue from a thread. False if stopped first."""
+    future = asyncio.run_coroutine_threadsafe(queue.put(item), loop)
+    while True:
+        try:
+            future.result(timeout=0.1)
+            return True
+        except FutureTimeoutError:
+            # The consumer may have stopped reading (cancel/error); don't hang on it
+            if stop.is_set():
+                future.cancel()
+                return False
+
+
+def _scan_into_queue(folder_path: str, loop: asyncio.AbstractEventLoop,
+                     queue: asyncio.Queue, stop: threading.Event):
+    """
+    Walk a folder in a worker thread, counting files into indexing_state and
+    handing them to the event loop through `queue`. Ends with a None sentinel.
+    The queue is bounded, so the walk blocks once it is SCAN_QUEUE_SIZE files
+    ahead of indexing and memory stays O(depth + SCAN_QUEUE_SIZE).
+    """
+    try:
+        for item in scan_folder(folder_path):
+            if stop.is_set():
+                break
+            indexing_state["total_files"] += 1
+            if not _put_blocking(loop, queue, item, stop):
+                break
+    finally:
+        indexing_state["scanning"] = False
+        if not stop.is_set():
+            _put_blocking(loop, queue, None, stop)
 
 
 def _merge_results(results: list[dict]) -> dict:
@@ -80,24 +165,48 @@ def _merge_results(results: list[dict]) -> dict:
     }
 
 
-async def index_file(file_path: str) -> bool:
+async def _store(pending: Optional[list], *row):
+    """Write a file record now (off the event loop), or buffer it in `pending` for a bulk flush."""
+    if pending is None:
+        await asyncio.to_thread(upsert_file, *row)
+    else:
+        pending.append(row)
+
+
+async def index_file(file_path: str, pending: Optional[list] = None,
+                     mtime_cache: Optional[dict[str, float]] = None,
+                     file_size: Optional[int] = None,
+                     modified_time: Optional[float] = None,
+                     parsed: Optional[tuple[Optional[str], str]] = None) -> bool:
     """
     Index a single file: parse -> LLM -> database.
+    If `pending` is given, the DB row is appended to it instead of being
+    written immediately (the caller flushes it with upsert_files_bulk).
+    If `mtime_cache` is given (from get_all_modified_times), it is used for
+    the "already indexed?" check instead of a per-file DB query.
+    `file_size`/`modified_time` can be passed in from scan_folder to avoid
+    stat'ing the file again, and `parsed` is a pre-fetched parse_file() result.
     Returns True if successful, False otherwise.
     """
     try:
         file_path = os.path.normpath(file_path)
         file_name = os.path.basename(file_path)
-        file_type = os.path.splitext(file_path)[1].lower()
-        file_size = os.path.getsize(file_path)
-        modified_time = os.path.getmtime(file_path)
+        file_type = get_file_ext(file_path)
+        if file_type in BINARY_SKIP_EXTENSIONS:
+            return True  # Nothing to index (e.g. a watcher event for an archive)
+        if file_size is None or modified_time is None:
+            st = os.stat(file_path)
+            file_size, modified_time = st.st_size, st.st_mtime
 
         # Check if file needs re-indexing
-        stored_mtime = get_file_modified_time(file_path)
+        if mtime_cache is not None:
+            stored_mtime = mtime_cache.get(file_path)
+        else:
+            stored_mtime = await asyncio.to_thread(get_file_modified_time, file_path)
         if stored_mtime is not None and abs(stored_mtime - modified_time) < 1:
             return True  # Already indexed and not modified
 
-        category = get_file_category(file_path)
+        category = get_file_category(file_path, file_type)
 
         if category == "image":
             # Use vision model directly
@@ -105,28 +214,29 @@ async def index_file(file_path: str) -> bool:
             raw_text = ""
         elif category == "document":
             # Hybrid approach: extract text + extract images, send both to LLM
-            result = await _index_document(file_path, file_name)
+            text_content, _ = parsed if parsed is not None else await _parse_async(file_path)
+            result = await _index_document(file_path, file_name, text_content)
             raw_text = ""
-            # Also try to get raw text for search
-            text_content, _ = parse_file(file_path)
+            # Also keep the raw text for search
             if text_content and text_content.strip():
                 raw_text = text_content
         else:
             # Parse text content first
-            text_content, parsed_category = parse_file(file_path)
+            text_content, parsed_category = parsed if parsed is not None else await _parse_async(file_path)
             if text_content is None and parsed_category == "error":
                 return False
             if text_content is None or not text_content.strip():
                 # Empty file, store with minimal info
-                upsert_file(
-                    file_path=file_path,
-                    file_name=file_name,
-                    file_type=file_type,
-                    file_size=file_size,
-                    modified_time=modified_time,
-                    summary=f"Empty or binary file: {file_name}",
-                    keywords=file_name,
-                    raw_text="",
+                await _store(
+                    pending,
+                    file_path,
+                    file_name,
+                    file_type,
+                    file_size,
+                    modified_time,
+                    f"Empty or binary file: {file_name}",  # summary
+                    file_name,  # keywords
+                    "",  # raw_text
                 )
                 return True
 
@@ -138,15 +248,16 @@ async def index_file(file_path: str) -> bool:
         keywords_list = result.get("keywords", [])
         keywords_str = ", ".join(keywords_list)
         ai_logger.info(f"[Indexer] {file_name}: Saving to DB. Summary len={len(result.get('summary', ''))}")
-        upsert_file(
-            file_path=file_path,
-            file_name=file_name,
-            file_type=file_type,
-            file_size=file_size,
-            modified_time=modified_time,
-            summary=result.get("summary", ""),
-            keywords=keywords_str,
-            raw_text=raw_text if category != "image" else "",
+        await _store(
+            pending,
+            file_path,
+            file_name,
+            file_type,
+            file_size,
+            modified_time,
+            result.get("summary", ""),
+            keywords_str,
+            raw_text if category != "image" else "",
         )
         return True
 
@@ -155,7 +266,26 @@ async def index_file(file_path: str) -> bool:
         return False
 
 
-async def _index_document(file_path: str, file_name: str) -> dict:
+async def _parse_async(file_path: str) -> tuple[Optional[str], str]:
+    """Run parse_file() on the parser thread pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_parse_executor, parse_file, file_path)
+
+
+def _prefetch_parse(file_path: str, modified_time: float,
+                    mtime_cache: dict[str, float]) -> Optional[asyncio.Future]:
+    """Start parsing a file in the background, unless index_file() will skip it."""
+    file_path = os.path.normpath(file_path)
+    stored_mtime = mtime_cache.get(file_path)
+    if stored_mtime is not None and abs(stored_mtime - modified_time) < 1:
+        return None
+    if get_file_category(file_path) == "image":
+        return None
+    loop = asyncio.get_running_loop()
+    return loop.run_in_executor(_parse_executor, parse_file, file_path)
+
+
+async def _index_document(file_path: str, file_name: str, text_content: Optional[str]) -> dict:
     """
     Index a document file (PDF, DOCX, XLSX, PPTX) using a hybrid approach:
     1. Extract text → send to text LLM for keyword extraction
@@ -164,8 +294,7 @@ async def _index_document(file_path: str, file_name: str) -> dict:
     """
     results = []
 
-    # Step 1: Text extraction → LLM
-    text_content, _ = parse_file(file_path)
+    # Step 1: Extracted text → LLM
     if text_content and text_content.strip():
         try:
             text_result = await extract_keywords(text_content, file_name)
@@ -180,13 +309,18 @@ async def _index_document(file_path: str, file_name: str) -> dict:
         image_paths = get_document_images(file_path)
         if image_paths:
             print(f"[Indexer] {file_name}: found {len(image_paths)} images, analyzing...")
-            # Process up to 5 images to avoid being too slow
-            for i, img_path in enumerate(image_paths[:5]):
-                try:
-                    img_result = await describe_image(img_path, f"{file_name} (image {i+1})")
+            # Process up to 5 images to avoid being too slow; they are sent
+            # concurrently and llm._chat bounds how many hit Ollama at once
+            img_results = await asyncio.gather(
+                *(describe_image(img_path, f"{file_name} (image {i+1})")
+                  for i, img_path in enumerate(image_paths[:5])),
+                return_exceptions=True,
+            )
+            for i, img_result in enumerate(img_results):
+                if isinstance(img_result, Exception):
+                    print(f"[Indexer] Error describing image {i+1} from {file_name}: {img_result}")
+                else:
                     results.append(img_result)
-                except Exception as e:
-                    print(f"[Indexer] Error describing image {i+1} from {file_name}: {e}")
     except Exception as e:
         print(f"[Indexer] Error extracting images from {file_name}: {e}")
     finally:
@@ -214,18 +348,20 @@ async def index_folder(folder_path: str):
         "folder": folder_path,
         "total_files": 0,
         "processed_files": 0,
+        "scanning": True,
         "current_file": "Scanning folder...",
         "errors": [],
         "start_time": time.time(),
     })
 
+    pending = []
+    # If the index is cleared mid-run, buffered rows from before the clear are dropped
+    clear_gen = get_clear_generation()
+    stop_scan = threading.Event()
+    scanner = None
     try:
-        # Scan for files
-        files = scan_folder(folder_path)
-        indexing_state["total_files"] = len(files)
-        
         # Add to watched folders
-        add_watched_folder(folder_path)
+        await asyncio.to_thread(add_watched_folder, folder_path)
         
         # Start watching immediately if watcher is running
         try:
@@ -234,26 +370,90 @@ async def index_folder(folder_path: str):
         except ImportError:
             pass
 
-        # Index files one by one (local LLM = sequential is better)
-        ai_logger.info(f"[Indexer] Starting to index {len(files)} files in {folder_path}")
-        for i, file_path in enumerate(files):
+        # Load stored mtimes once instead of querying per file
+        mtime_cache = await asyncio.to_thread(get_all_modified_times)
+
+        # Index files one by one (local LLM = sequential is better), while the
+        # next PARSE_PREFETCH files are parsed in the background.
+        # The folder is walked in a worker thread (scandir/stat can stall on
+        # network drives); total_files grows until the walk finishes.
+        ai_logger.info(f"[Indexer] Starting to index files in {folder_path}")
+        found = asyncio.Queue(maxsize=SCAN_QUEUE_SIZE)
+        scanner = asyncio.ensure_future(asyncio.to_thread(
+            _scan_into_queue, folder_path, asyncio.get_running_loop(), found, stop_scan
+        ))
+        scan_done = False
+        window = deque()
+        i = 0
+        last_flush = time.monotonic()
+        while True:
+            while len(window) < PARSE_PREFETCH and not scan_done:
+                if window:
+                    # Keep working on what we have rather than wait for the walk
+                    try:
+                        item = found.get_nowait()
+                    except asyncio.QueueEmpty:
+                        break
+                else:
+                    item = await found.get()
+                if item is None:
+                    scan_done = True
+                    break
+                file_path, file_size, modified_time = item
+                window.append((item, _prefetch_parse(file_path, modified_time, mtime_cache)))
+            if not window:
+                break
+
             if indexing_state.get("cancel"):
                 ai_logger.info("[Indexer] Indexing cancelled.")
+                for _, future in window:
+                    if future is not None:
+                        future.cancel()
                 break
-                
+
+            (file_path, file_size, modified_time), future = window.popleft()
             indexing_state["current_file"] = os.path.basename(file_path)
             indexing_state["processed_files"] = i
+            i += 1
 
-            success = await index_file(file_path)
+            parsed = None
+            if future is not None:
+                try:
+                    parsed = await future
+                except Exception as e:
+                    print(f"[Indexer] Error parsing {file_path}: {e}")
+                    parsed = (None, "error")
+
+            success = await index_file(file_path, pending, mtime_cache,
+                                       file_size=file_size, modified_time=modified_time,
+                                       parsed=parsed)
             if not success:
                 indexing_state["errors"].append(file_path)
 
-        indexing_state["processed_files"] = len(files)
+            if pending and (len(pending) >= DB_BATCH_SIZE
+                            or time.monotonic() - last_flush >= DB_FLUSH_INTERVAL):
+                await asyncio.to_thread(upsert_files_bulk, pending, clear_gen)
+                pending.clear()
+                last_flush = time.monotonic()
+
+        indexing_state["processed_files"] = i
         indexing_state["current_file"] = "Done!"
 
     except Exception as e:
         indexing_state["errors"].append(f"Fatal error: {e}")
     finally:
+        stop_scan.set()
+        if scanner is not None:
+            try:
+                await scanner
+            except Exception as e:
+                indexing_state["errors"].append(f"Folder scan error: {e}")
+        indexing_state["scanning"] = False
+        # Flush whatever is still buffered (also on cancel/error, but not past a clear)
+        try:
+            await asyncio.to_thread(upsert_files_bulk, pending, clear_gen)
+        except Exception as e:
+            indexing_state["errors"].append(f"DB flush error: {e}")
         indexing_state["is_indexing"] = False
         indexing_state["cancel"] = False
 
@@ -32,6 +32,12 @@ class BackgroundLauncher:
         self.server_process = None
         self.is_running = False
         self.icon = None
+        self.status = "Stopped"
+        # Bumped by every start/stop; a launch thread only acts while its
+        # generation is still current, so a stop/restart during the ES wait
+        # can't leave a second uvicorn behind
+        self._launch_gen = 0
+        self._lock = threading.Lock()
         
     def create_icon_image(self):
         # Generate a sleek icon: Purple square with a white "F"
@@ -108,19 +114,38 @@ class BackgroundLauncher:
             logging.error(f"Error checking/starting ES service: {e}")
             return False
 
+    def set_status(self, status):
+        """Update the tray tooltip (only remembered until the icon exists)."""
+        self.status = status
+        if self.icon is not None:
+            self.icon.title = f"File Guessr ({status})"
+
     def start_server(self):
+        """Kick off server startup without blocking the caller (tray/menu thread)."""
         logging.info("Starting server...")
-        if self.is_running:
-            logging.info("Server already marked as running.")
-            return
+        with self._lock:
+            if self.is_running:
+                logging.info("Server already marked as running.")
+                return
+            self.is_running = True
+            self._launch_gen += 1
+            gen = self._launch_gen
 
+        self.set_status("Starting...")
+        # Waiting for ES and spawning uvicorn can take a while; do it off this thread
+        threading.Thread(target=self.launch_server, args=(gen,), daemon=True).start()
+
+    def launch_server(self, gen):
         # Ensure ES is up before the app tries to connect
         self.ensure_es_service()
 
         # Check if port 8000 is already in use
         if self.is_port_in_use(8000):
+            with self._lock:
+                if gen != self._launch_gen:
+                    return
             logging.info("Port 8000 already in use, assuming server is up.")
-            self.is_running = True
+            self.set_status("Running")
             return
 
         try:
@@ -147,44 +172,72 @@ class BackgroundLauncher:
                 startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
                 startupinfo.wShowWindow = 0 # SW_HIDE
             
-            self.server_process = subprocess.Popen(
-                cmd, 
-                startupinfo=startupinfo,
-                creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0,
-                stdout=server_log,
-                stderr=server_log,
-                cwd=base_dir,
-                text=True
-            )
+            with self._lock:
+                if gen != self._launch_gen:
+                    logging.info("Server stopped while waiting for Elasticsearch, not launching.")
+                    server_log.close()
+                    return
+                process = subprocess.Popen(
+                    cmd, 
+                    startupinfo=startupinfo,
+                    creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0,
+                    stdout=server_log,
+                    stderr=server_log,
+                    cwd=base_dir,
+                    text=True
+                )
+                self.server_process = process
             
-            logging.info(f"Server process started with PID {self.server_process.pid}")
-            self.is_running = True
+            logging.info(f"Server process started with PID {process.pid}")
             # Auto-open browser after a short delay
             threading.Timer(2.0, self.open_browser).start()
-            
-            # Start monitoring thread
-            threading.Thread(target=self.monitor_process, daemon=True).start()
-            
         except Exception as e:
             logging.error(f"Failed to start server: {e}", exc_info=True)
+            with self._lock:
+                if gen != self._launch_gen:
+                    return
+                self.is_running = False
+            self.set_status("Error")
+            return
+
+        self.monitor_process(process, gen)
 
     def is_port_in_use(self, port):
         with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
             return s.connect_ex(('127.0.0.1', port)) == 0
 
-    def monitor_process(self):
-        while self.is_running and self.server_process:
-            if self.server_process.poll() is not None:
-                self.is_running = False
-                self.server_process = None
-                break
+    def monitor_process(self, process, gen):
+        # Startup: poll quickly for the first second to catch an immediate crash
+        deadline = time.time() + 1.0
+        while time.time() < deadline and process.poll() is None:
+            time.sleep(0.05)
+        crashed_on_startup = process.poll() is not None
+        if crashed_on_startup:
+            logging.error(f"Server exited during startup with code {process.returncode} (see server.log)")
+        elif gen == self._launch_gen:
+            self.set_status("Running")
+
+        while gen == self._launch_gen and process.poll() is None:
             time.sleep(2)
 
+        with self._lock:
+            if gen != self._launch_gen:
+                # Stopped or restarted from the menu; that path owns the status
+                return
+            self.is_running = False
+            self.server_process = None
+        self.set_status("Error" if crashed_on_startup else "Stopped")
+
     def stop_server(self):
-        if self.server_process:
-            self.server_process.terminate()
+        with self._lock:
+            # Invalidate any launch still waiting for Elasticsearch
+            self._launch_gen += 1
+            process = self.server_process
             self.server_process = None
-        self.is_running = False
+            self.is_running = False
+        if process:
+            process.terminate()
+        self.set_status("Stopped")
 
     def open_browser(self, icon=None, item=None):
         webbrowser.open(API_URL)
@@ -209,7 +262,7 @@ class BackgroundLauncher:
                 pystray.Menu.SEPARATOR,
                 pystray.MenuItem("退出", self.on_exit)
             )
-            self.icon = pystray.Icon("File Guessr", image, "File Guessr (Running)", menu)
+            self.icon = pystray.Icon("File Guessr", image, f"File Guessr ({self.status})", menu)
             logging.info("Tray icon running.")
             self.icon.run()
         except Exception as e:
@@ -3,12 +3,18 @@ LLM integration - Ollama API calls for keyword extraction, image description, an
 All outputs are in English for consistent indexing.
 """
 import httpx
+import asyncio
 import base64
-import json
+import io
+import orjson
 import re
 import logging
 import os
+import time
+import unicodedata
+from collections import OrderedDict
 from typing import Optional
+from PIL import Image, ImageOps
 
 # Setup AI Logger
 ai_log_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ai.log")
@@ -23,6 +29,43 @@ ai_logger.addHandler(handler)
 
 OLLAMA_BASE_URL = "http://127.0.0.1:11434"
 TIMEOUT = 300.0  # seconds - local model can be slow
+# How long Ollama keeps the model loaded after a request (its default is 5m).
+# Reloading a model after it's been unloaded costs seconds on the next search.
+KEEP_ALIVE = "30m"
+
+# Max concurrent requests to Ollama; match the server's OLLAMA_NUM_PARALLEL.
+# Extra requests would only queue inside Ollama while holding a connection.
+OLLAMA_NUM_PARALLEL = int(os.getenv("OLLAMA_NUM_PARALLEL", "4"))
+_chat_semaphore = asyncio.Semaphore(OLLAMA_NUM_PARALLEL)
+# Chat slots plus headroom for health checks
+HTTP_MAX_CONNECTIONS = OLLAMA_NUM_PARALLEL + 2
+
+# Shared HTTP client so every Ollama call reuses pooled keep-alive connections.
+# main.py's lifespan creates it and hands it over via set_client().
+_client: Optional[httpx.AsyncClient] = None
+
+
+def create_client() -> httpx.AsyncClient:
+    """Create the pooled AsyncClient used for all Ollama requests."""
+    return httpx.AsyncClient(
+        timeout=TIMEOUT,
+        limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS,
+                            max_keepalive_connections=HTTP_MAX_CONNECTIONS),
+    )
+
+
+def set_client(client: Optional[httpx.AsyncClient]):
+    """Install (or clear, with None) the shared AsyncClient."""
+    global _client
+    _client = client
+
+
+def _get_client() -> httpx.AsyncClient:
+    """Get the shared client, creating one lazily when running outside the app."""
+    global _client
+    if _client is None:
+        _client = create_client()
+    return _client
 
 # Simple cache for the model name to avoid constant DB reads
 _cached_model = None
@@ -48,57 +91,123 @@ def _clear_llm_cache():
     _cached_model = None
 
 
-async def _chat(prompt: str, image_path: Optional[str] = None) -> str:
-    """Send a chat request to Ollama."""
+# Images are shrunk to this size on the long edge before being sent: it is
+# gemma3's native vision input, so extra pixels only cost transfer and decode time
+IMAGE_MAX_SIDE = 896
+IMAGE_JPEG_QUALITY = 85
+
+
+def _encode_image(image_path: str) -> str:
+    """Read an image file, downscale it if needed, and return it base64-encoded for the Ollama API."""
+    with open(image_path, "rb") as f:
+        raw = f.read()
+    try:
+        with Image.open(io.BytesIO(raw)) as img:
+            if max(img.size) > IMAGE_MAX_SIDE:
+                # Apply the EXIF rotation, since re-encoding drops the tag
+                img = ImageOps.exif_transpose(img)
+                img.thumbnail((IMAGE_MAX_SIDE, IMAGE_MAX_SIDE))
+                buf = io.BytesIO()
+                img.convert("RGB").save(buf, "JPEG", quality=IMAGE_JPEG_QUALITY)
+                raw = buf.getvalue()
+    except Exception as e:
+        # Send the original bytes if Pillow can't handle the file
+        ai_logger.warning(f"Could not downscale {image_path}: {e}")
+    return base64.b64encode(raw).decode("ascii")
+
+
+async def _chat(prompt: str, image_path: Optional[str] = None,
+                options: Optional[dict] = None, system: Optional[str] = None) -> str:
+    """Send a chat request to Ollama. `options` overrides the default sampling options.
+    `system` should be a static prompt so Ollama can reuse its cached prefix across calls.
+    """
     model = get_model_name().strip() # Ensure no newlines/spaces
     messages = [{"role": "user", "content": prompt}]
+    if system:
+        messages.insert(0, {"role": "system", "content": system})
 
-    # If image, encode as base64 and attach
+    # If image, encode as base64 and attach. Large photos take a while to
+    # read and encode, so do it in a worker thread instead of on the loop.
     if image_path:
-        with open(image_path, "rb") as f:
-            img_data = base64.b64encode(f.read()).decode("utf-8")
-        messages[0]["images"] = [img_data]
+        img_data = await asyncio.to_thread(_encode_image, image_path)
+        messages[-1]["images"] = [img_data]
 
     payload = {
         "model": model,
         "messages": messages,
         "stream": False,
+        "keep_alive": KEEP_ALIVE,
         "options": {
             "temperature": 0.1,  # Lower temperature for even more consistent JSON outputs
             # Removed num_predict: 1024 as it causes empty responses in Qwen/Vision models
         }
     }
+    if options:
+        payload["options"].update(options)
 
-    async with httpx.AsyncClient(timeout=TIMEOUT) as client:
-        try:
-            response = await client.post(
+    try:
+        async with _chat_semaphore:
+            # orjson encodes the (possibly multi-MB base64 image) body much faster than json
+            response = await _get_client().post(
                 f"{OLLAMA_BASE_URL}/api/chat",
-                json=payload,
+                content=orjson.dumps(payload),
+                headers={"Content-Type": "application/json"},
             )
-            if response.status_code == 404:
-                raise Exception(f"Model '{model}' not found in Ollama. Please download it or select another model.")
-            response.raise_for_status()
-            data = response.json()
-            content = data["message"]["content"]
-            ai_logger.info(f"Model '{model}' responded. Content length: {len(content)}")
-            ai_logger.debug(f"Raw Output: {content}")
-            return content
-        except httpx.ConnectError:
-            raise Exception("Cannot connect to Ollama. Is it running?")
-        except Exception as e:
-            raise e
+        if response.status_code == 404:
+            raise Exception(f"Model '{model}' not found in Ollama. Please download it or select another model.")
+        response.raise_for_status()
+        data = orjson.loads(response.content)
+        content = data["message"]["content"]
+        ai_logger.info(f"Model '{model}' responded. Content length: {len(content)}")
+        ai_logger.debug(f"Raw Output: {content}")
+        return content
+    except httpx.ConnectError:
+        raise Exception("Cannot connect to Ollama. Is it running?")
+    except Exception as e:
+        raise e
+
+
+# Patterns used on every LLM response, compiled once
+_FENCE_START_RE = re.compile(r'^```(?:json|JSON)?\s*')
+_FENCE_END_RE = re.compile(r'```\s*$')
+_FENCE_INLINE_RE = re.compile(r'```(?:json|JSON)?([\s\S]*?)```')
+_FENCE_BLOCK_RE = re.compile(r'```.*?```', re.DOTALL)
+_TRAILING_COMMA_RE = re.compile(r',\s*([\]}])')
+_KEYWORD_SPLIT_RE = re.compile(r'[;,\n]')
+_KEYWORD_ARRAY_RE = re.compile(r'["\']?keywords["\']?\s*:\s*\[([^\]]+)\]', re.IGNORECASE | re.DOTALL)
+_KEYWORD_ITEM_RE = re.compile(r'["\']([^"\']+)["\']|([^,\[\]\n"\'\.]+)')
+_PREFIX_RE = re.compile(r'^(keywords|answer|result)\s*:\s*', re.IGNORECASE)
 
 
 def _strip_markdown_fences(text: str) -> str:
     """Remove markdown code fences like ```json ... ``` that Qwen/other models add."""
+    text = text.strip()
+    if "```" not in text:
+        return text
     # Remove ```json ... ``` or ``` ... ``` blocks, keeping only the inner content
-    text = re.sub(r'^```(?:json|JSON)?\s*', '', text.strip())
-    text = re.sub(r'```\s*$', '', text.strip())
+    text = _FENCE_START_RE.sub('', text)
+    text = _FENCE_END_RE.sub('', text.strip())
     # Also handle inline fences in the middle
-    text = re.sub(r'```(?:json|JSON)?([\s\S]*?)```', r'\1', text)
+    text = _FENCE_INLINE_RE.sub(r'\1', text)
     return text.strip()
 
 
+def _clean_keywords_response(response: str) -> str:
+    """Reduce a query-expansion reply to its single line of keywords."""
+    # Remove quotes if present
+    keywords = response.strip().strip('"').strip("'")
+
+    # Take the last line that looks like keywords (often LLMs put explanation first)
+    for line in reversed(keywords.split("\n")):
+        line = line.strip()
+        if line and len(line.split()) > 1:
+            keywords = line
+            break
+
+    # Remove common prefixes LLMs might add
+    return _PREFIX_RE.sub('', keywords)
+
+
 def _parse_json_response(text: str) -> dict:
     """Try to extract JSON from LLM response with high resilience.
     Handles Qwen-style markdown fences, trailing commas, and other quirks.
@@ -107,7 +216,7 @@ def _parse_json_response(text: str) -> dict:
         return {"summary": "", "keywords": []}
 
     # Step 0: Strip markdown code fences (Qwen, Mistral etc. love adding these)
-    text = _strip_markdown_fences(text).strip()
+    text = _strip_markdown_fences(text)
 
     data = None
 
@@ -118,13 +227,13 @@ def _parse_json_response(text: str) -> dict:
     if first_brace != -1 and last_brace != -1 and last_brace > first_brace:
         json_str = text[first_brace:last_brace+1]
         try:
-            data = json.loads(json_str)
-        except json.JSONDecodeError:
+            data = orjson.loads(json_str)
+        except orjson.JSONDecodeError:
             # Fix trailing commas, then retry
-            json_str_fixed = re.sub(r',\s*([\]}])', r'\1', json_str)
+            json_str_fixed = _TRAILING_COMMA_RE.sub(r'\1', json_str)
             try:
-                data = json.loads(json_str_fixed)
-            except json.JSONDecodeError:
+                data = orjson.loads(json_str_fixed)
+            except orjson.JSONDecodeError:
                 pass
 
     if data and isinstance(data, dict):
@@ -137,7 +246,7 @@ def _parse_json_response(text: str) -> dict:
             if key in data_low:
                 val = data_low[key]
                 if isinstance(val, str):
-                    keywords = [k.strip() for k in re.split(r'[;,\n]', val) if k.strip()]
+                    keywords = [k.strip() for k in _KEYWORD_SPLIT_RE.split(val) if k.strip()]
                 elif isinstance(val, list):
                     keywords = [str(k).strip() for k in val if k]
                 break
@@ -160,13 +269,11 @@ def _parse_json_response(text: str) -> dict:
 
     # Step 2: Regex fallback — try to extract keywords array directly
     # Handles cases like:  "keywords": ["a", "b", "c"]
-    kw_array_match = re.search(
-        r'["\']?keywords["\']?\s*:\s*\[([^\]]+)\]', text, re.IGNORECASE | re.DOTALL
-    )
+    kw_array_match = _KEYWORD_ARRAY_RE.search(text)
     if kw_array_match:
         raw_items = kw_array_match.group(1)
         # Extract quoted strings or bare words
-        keywords = re.findall(r'["\']([^"\']+)["\']|([^,\[\]\n"\'\.]+)', raw_items)
+        keywords = _KEYWORD_ITEM_RE.findall(raw_items)
         keywords = [a or b for a, b in keywords]
         keywords = [k.strip() for k in keywords if k.strip()]
         if keywords:
@@ -182,24 +289,31 @@ def _parse_json_response(text: str) -> dict:
             keywords.append(line[2:].strip())
         elif ":" in line and any(k in line.lower() for k in ["keywords", "tags", "labels"]):
             parts = line.split(":", 1)[1]
-            keywords.extend([k.strip() for k in re.split(r'[;,\n]', parts) if k.strip()])
+            keywords.extend([k.strip() for k in _KEYWORD_SPLIT_RE.split(parts) if k.strip()])
 
-    clean_text = re.sub(r'```.*?```', '', text, flags=re.DOTALL).strip()
+    clean_text = _FENCE_BLOCK_RE.sub('', text).strip()
     result = {"summary": clean_text if clean_text else text.strip(), "keywords": list(set(keywords))}
     ai_logger.info(f"Fallback parse: {len(result['keywords'])} keywords found.")
     return result
 
 
-async def extract_keywords(text: str, file_name: str) -> dict:
-    """
-    Extract keywords and summary from text content.
-    Returns: {"summary": str, "keywords": [str]}
-    """
-    prompt = f"""Analyze this file and extract information for search indexing.
-File name: {file_name}
+# File content sent to the model is capped in characters and in UTF-8 bytes,
+# so CJK text (3 bytes/char, ~1 token/char) doesn't get a far bigger prompt than English.
+PROMPT_MAX_CHARS = 3000
+PROMPT_MAX_BYTES = 6000
 
-CONTENT:
-{text[:3000]}
+
+def _truncate(text: str, max_chars: int = PROMPT_MAX_CHARS,
+              max_bytes: int = PROMPT_MAX_BYTES) -> str:
+    """Cut text to max_chars characters and max_bytes UTF-8 bytes, never splitting a character."""
+    text = text[:max_chars]
+    return text.encode("utf-8")[:max_bytes].decode("utf-8", "ignore")
+
+
+# Static system prompts. They are sent unchanged on every call, with the
+# per-request payload (file name, content, query) in the user message after
+# them, so Ollama can reuse the KV cache of the shared prefix.
+SYSTEM_EXTRACT = """Analyze the file given by the user and extract information for search indexing.
 
 INSTRUCTIONS:
 - Respond ONLY with a valid JSON object. No markdown, no code fences, no explanation before or after.
@@ -213,30 +327,10 @@ INSTRUCTIONS:
 - Keep original proper nouns even if they are not in English (e.g. "東京", "台北101")
 
 OUTPUT FORMAT (respond with ONLY this, no additional text):
-{{"summary": "Detailed comprehensive description of the file content", "keywords": ["keyword1", "keyword2", "keyword3"]}}"""
-
-    try:
-        ai_logger.info(f"Extracting keywords for {file_name}...")
-        response = await _chat(prompt)
-        result = _parse_json_response(response)
-        # Ensure required fields
-        if "summary" not in result:
-            result["summary"] = ""
-        if "keywords" not in result:
-            result["keywords"] = []
-        return result
-    except Exception as e:
-        print(f"[LLM] Error extracting keywords for {file_name}: {e}")
-        return {"summary": f"Error processing file: {file_name}", "keywords": []}
+{"summary": "Detailed comprehensive description of the file content", "keywords": ["keyword1", "keyword2", "keyword3"]}"""
 
-
-async def describe_image(image_path: str, file_name: str) -> dict:
-    """
-    Describe an image in extreme detail using vision model.
-    Returns: {"summary": str, "keywords": [str]}
-    """
-    prompt = f"""Act as a high-fidelity image scanner and deep analysis system for search indexing.
-File name: {file_name}
+SYSTEM_DESCRIBE = """Act as a high-fidelity image scanner and deep analysis system for search indexing.
+The user sends an image and its file name.
 
 INSTRUCTIONS: Analyze this image with EXTREME precision. Extract and list EVERYTHING visible, especially background details that are often missed.
 
@@ -272,10 +366,75 @@ CRITICAL:
   - "machine learning" NOT "machine", "learning"
 
 FORMAT:
-{{"summary": "...", "keywords": ["keyword1", "keyword2", ...]}}"""
+{"summary": "...", "keywords": ["keyword1", "keyword2", ...]}"""
+
+SYSTEM_EXPAND = """You are an expert search query expansion system. The user wants to find files on their computer based on a natural language query.
+
+INSTRUCTIONS:
+1. Extract the core intent from the query.
+2. Generate highly relevant English search keywords to match the files they are looking for.
+3. Include synonyms, related technical terms, broad categories, and specific examples.
+4. If the query is not in English, translate the core concepts into English keywords.
+5. For visual concepts, include words describing the image contents (colors, objects, scenes).
+6. Example: "沙灘照片" → beach sand ocean sea coast shore waves tropical photo sunny water vacation seaside nature
+
+CRITICAL:
+Respond with ONLY a single line of space-separated English keywords (15-30 keywords).
+DO NOT include prefixes like "Here are the keywords:" or "Keywords:".
+DO NOT include any explanation or punctuation. JUST THE WORDS."""
+
+SYSTEM_EXPAND_FILE = """You are a multi-modal high-fidelity search query expansion system.
+The user provides a text query and/or an uploaded file (text content or image).
+
+INSTRUCTIONS:
+1. Perform a Deep Visual/Content Audit:
+   - For images: Index ALL background elements, transcribing text on boards/screens and describing specific human actions (gestures, postures, tool usage).
+   - For documents: Extract technical formulas, specific named entities, and deep topical metadata.
+2. Generate space-separated English keywords (35-60 keywords) that represent:
+   - Core visual components (foreground/background).
+   - Transcribed text, math expressions, and branding.
+   - Specific user intent combined with file context.
+   - Professional/domain synonyms and related concepts.
+
+CRITICAL:
+Respond with ONLY a single line of space-separated English keywords.
+DO NOT include any conversational text, prefixes, or punctuation. JUST THE WORDS."""
+
+
+async def extract_keywords(text: str, file_name: str) -> dict:
+    """
+    Extract keywords and summary from text content.
+    Returns: {"summary": str, "keywords": [str]}
+    """
+    prompt = f"""File name: {file_name}
+
+CONTENT:
+{_truncate(text)}"""
 
     try:
-        response = await _chat(prompt, image_path=image_path)
+        ai_logger.info(f"Extracting keywords for {file_name}...")
+        response = await _chat(prompt, options={"temperature": 0}, system=SYSTEM_EXTRACT)
+        result = _parse_json_response(response)
+        # Ensure required fields
+        if "summary" not in result:
+            result["summary"] = ""
+        if "keywords" not in result:
+            result["keywords"] = []
+        return result
+    except Exception as e:
+        print(f"[LLM] Error extracting keywords for {file_name}: {e}")
+        return {"summary": f"Error processing file: {file_name}", "keywords": []}
+
+
+async def describe_image(image_path: str, file_name: str) -> dict:
+    """
+    Describe an image in extreme detail using vision model.
+    Returns: {"summary": str, "keywords": [str]}
+    """
+    prompt = f"File name: {file_name}"
+
+    try:
+        response = await _chat(prompt, image_path=image_path, system=SYSTEM_DESCRIBE)
         result = _parse_json_response(response)
         if "summary" not in result:
             result["summary"] = ""
@@ -287,77 +446,129 @@ FORMAT:
         return {"summary": f"Image file: {file_name}", "keywords": []}
 
 
-async def expand_query(user_query: str) -> str:
+# Query expansion cache: (model, normalized query) -> (timestamp, keywords).
+# Users re-run and refine the same searches a lot; a hit skips the LLM entirely.
+EXPAND_CACHE_MAX = 1024
+EXPAND_CACHE_TTL = 3600  # seconds
+_expand_cache: "OrderedDict[tuple[str, str], tuple[float, str]]" = OrderedDict()
+
+
+def normalize_query(query: str) -> str:
+    """Normalize a query for cache keys (width/compatibility forms, case, whitespace)."""
+    return " ".join(unicodedata.normalize("NFKC", query).casefold().split())
+
+
+def _get_cached_expansion(key: tuple[str, str]) -> Optional[str]:
+    entry = _expand_cache.get(key)
+    if entry is None:
+        return None
+    cached_at, keywords = entry
+    if time.time() - cached_at > EXPAND_CACHE_TTL:
+        del _expand_cache[key]
+        return None
+    _expand_cache.move_to_end(key)
+    return keywords
+
+
+def _cache_expansion(key: tuple[str, str], keywords: str):
+    _expand_cache[key] = (time.time(), keywords)
+    _expand_cache.move_to_end(key)
+    while len(_expand_cache) > EXPAND_CACHE_MAX:
+        _expand_cache.popitem(last=False)
+
+
+async def expand_query(user_query: str) -> Optional[str]:
     """
     Expand a natural language query into comprehensive English search keywords.
-    Returns a space-separated string of keywords for Elasticsearch search.
+    Returns a space-separated string of keywords for Elasticsearch search,
+    or None if the LLM couldn't expand it (Ollama down, model missing, empty reply).
+    Results are cached per model and normalized query (see EXPAND_CACHE_TTL).
     """
-    prompt = f"""You are an expert search query expansion system. The user wants to find files on their computer based on a natural language query.
+    cache_key = (get_model_name().strip(), normalize_query(user_query))
+    cached = _get_cached_expansion(cache_key)
+    if cached is not None:
+        ai_logger.info(f"Query expansion cache hit for '{user_query}'")
+        return cached
 
-USER QUERY: {user_query}
-
-INSTRUCTIONS:
-1. Extract the core intent from the query.
-2. Generate highly relevant English search keywords to match the files they are looking for.
-3. Include synonyms, related technical terms, broad categories, and specific examples.
-4. If the query is not in English, translate the core concepts into English keywords.
-5. For visual concepts, include words describing the image contents (colors, objects, scenes).
-6. Example: "沙灘照片" → beach sand ocean sea coast shore waves tropical photo sunny water vacation seaside nature
-
-CRITICAL:
-Respond with ONLY a single line of space-separated English keywords (15-30 keywords).
-DO NOT include prefixes like "Here are the keywords:" or "Keywords:".
-DO NOT include any explanation or punctuation. JUST THE WORDS."""
+    prompt = f"USER QUERY: {user_query}"
 
     try:
-        response = await _chat(prompt)
+        # Temperature 0 keeps expansions stable, which is what makes caching them valid
+        response = await _chat(prompt, options={"temperature": 0}, system=SYSTEM_EXPAND)
         # Clean up the response
         if not response:
-            return user_query
-            
-        # Remove quotes if present
-        keywords = response.strip().strip('"').strip("'")
-        
-        # Remove any lines that look like explanations ("Here are the keywords: ...")
-        lines = keywords.split("\n")
-        # Take the last line that looks like keywords (often LLMs put explanation first)
-        for line in reversed(lines):
-            line = line.strip()
-            if line and len(line.split()) > 1:
-                keywords = line
-                # Stop if we found a good candidate (not empty, more than 1 word)
-                break
-        
-        # Remove common prefixes LLMs might add
-        keywords = re.sub(r'^(keywords:|answer:|result:)\s*', '', keywords, flags=re.IGNORECASE)
-                
+            return None
+
+        keywords = _clean_keywords_response(response)
+        _cache_expansion(cache_key, keywords)
         return keywords
     except Exception as e:
         print(f"[LLM] Error expanding query: {e}")
-        return user_query
+        return None
+
+
+async def warm_model():
+    """Load the selected model into memory (or extend its keep-alive) without generating."""
+    model = get_model_name().strip()
+    try:
+        response = await _get_client().post(
+            f"{OLLAMA_BASE_URL}/api/generate",
+            content=orjson.dumps({"model": model, "keep_alive": KEEP_ALIVE}),
+            headers={"Content-Type": "application/json"},
+        )
+        response.raise_for_status()
+        ai_logger.info(f"Model '{model}' warmed (keep_alive={KEEP_ALIVE})")
+    except Exception as e:
+        ai_logger.warning(f"Could not warm model '{model}': {e}")
+
+
+# The UI polls /api/health, so the /api/tags answer (or failure) is reused briefly
+STATUS_CACHE_TTL = 2.0  # seconds
+# (fetched at, model names, names plus their ":tag"-less bases, error)
+_status_cache: Optional[tuple[float, list[str], frozenset[str], Optional[str]]] = None
+
+
+async def _get_available_models() -> tuple[list[str], frozenset[str]]:
+    """
+    List installed Ollama models, cached for STATUS_CACHE_TTL. Raises if Ollama is unreachable.
+    Returns (model names, set of names and base names for availability checks).
+    """
+    global _status_cache
+    now = time.monotonic()
+    if _status_cache is None or now - _status_cache[0] >= STATUS_CACHE_TTL:
+        try:
+            resp = await _get_client().get(f"{OLLAMA_BASE_URL}/api/tags", timeout=5.0)
+            resp.raise_for_status()
+            models = orjson.loads(resp.content).get("models", [])
+            names = [m["name"].strip() for m in models]
+            lookup = frozenset(names) | {name.split(":")[0] for name in names}
+            _status_cache = (now, names, lookup, None)
+        except Exception as e:
+            _status_cache = (now, [], frozenset(), str(e))
+
+    _, model_names, lookup, error = _status_cache
+    if error is not None:
+        raise Exception(error)
+    return model_names, lookup
 
 
 async def check_ollama_status() -> dict:
     """Check if Ollama is running and model is available."""
     try:
-        async with httpx.AsyncClient(timeout=5.0) as client:
-            # Check if Ollama is running
-            resp = await client.get(f"{OLLAMA_BASE_URL}/api/tags")
-            resp.raise_for_status()
-            models = resp.json().get("models", [])
-            model_names = [m["name"].strip() for m in models]
-            
-            current_model = get_model_name().strip()
-            # Loose match: check if the selected model name (before version) is in the available models
-            model_base = current_model.split(":")[0]
-            has_model = any(model_base in name or current_model in name for name in model_names)
-
-            return {
-                "ollama_running": True,
-                "model_available": has_model,
-                "available_models": model_names,
-                "selected_model": current_model,
-            }
+        # Check if Ollama is running
+        model_names, lookup = await _get_available_models()
+
+        current_model = get_model_name().strip()
+        # Loose match: the selected model, or its name before the ":tag", is installed
+        model_base = current_model.split(":")[0]
+        has_model = current_model in lookup or model_base in lookup
+
+        return {
+            "ollama_running": True,
+            "model_available": has_model,
+            "available_models": list(model_names),
+            "selected_model": current_model,
+        }
     except Exception as e:
         return {
             "ollama_running": False,
@@ -380,44 +591,16 @@ async def expand_query_with_file(user_query: str, file_content: Optional[str] =
         context_parts.append(f"USER TEXT QUERY: {user_query}")
 
     if file_content:
-        context_parts.append(f"UPLOADED FILE CONTENT:\n{file_content[:3000]}")
+        context_parts.append(f"UPLOADED FILE CONTENT:\n{_truncate(file_content)}")
 
     context = "\n\n".join(context_parts)
 
-    prompt = f"""You are a multi-modal high-fidelity search query expansion system.
-Context provided:
-{context}
-
-INSTRUCTIONS:
-1. Perform a Deep Visual/Content Audit:
-   - For images: Index ALL background elements, transcribing text on boards/screens and describing specific human actions (gestures, postures, tool usage).
-   - For documents: Extract technical formulas, specific named entities, and deep topical metadata.
-2. Generate space-separated English keywords (35-60 keywords) that represent:
-   - Core visual components (foreground/background).
-   - Transcribed text, math expressions, and branding.
-   - Specific user intent combined with file context.
-   - Professional/domain synonyms and related concepts.
-
-CRITICAL:
-Respond with ONLY a single line of space-separated English keywords.
-DO NOT include any conversational text, prefixes, or punctuation. JUST THE WORDS."""
-
     try:
-        response = await _chat(prompt, image_path=image_path)
+        response = await _chat(context, image_path=image_path, system=SYSTEM_EXPAND_FILE)
         if not response:
             return user_query or ""
 
-        # Clean up
-        keywords = response.strip().strip('"').strip("'")
-        lines = keywords.split("\n")
-        for line in reversed(lines):
-            line = line.strip()
-            if line and len(line.split()) > 1:
-                keywords = line
-                break
-
-        keywords = re.sub(r'^(keywords:|answer:|result:)\s*', '', keywords, flags=re.IGNORECASE)
-        return keywords
+        return _clean_keywords_response(response)
     except Exception as e:
         print(f"[LLM] Error expanding query with file: {e}")
         return user_query or ""
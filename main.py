@@ -12,17 +12,29 @@ import time
 from contextlib import asynccontextmanager
 from typing import Optional
 
-from fastapi import FastAPI, BackgroundTasks, Query, UploadFile, File, Form
+from fastapi import FastAPI, BackgroundTasks, Query, UploadFile, File, Form, Request
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, ORJSONResponse, Response
 
 import database
+import llm
 from indexer import index_folder, get_index_status
-from searcher import search_files
+from searcher import search_files, clean_search_terms
 from llm import check_ollama_status, expand_query_with_file
-from file_parser import parse_file, get_file_category
+from file_parser import parse_file, get_file_category, get_file_ext
 
 STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+# Re-warm well before llm.KEEP_ALIVE (30m) runs out
+KEEP_WARM_INTERVAL = 20 * 60  # seconds
+
+# Content types for /api/file/preview; anything else is sent as a generic download
+EXT_MIME = {
+    ".jpg": "image/jpeg", ".jpeg": "image/jpeg", ".png": "image/png",
+    ".gif": "image/gif", ".bmp": "image/bmp", ".webp": "image/webp",
+    ".tiff": "image/tiff", ".tif": "image/tiff", ".ico": "image/x-icon",
+}
+# Preview URLs carry the file's modified time (see app.js), so a given URL never changes
+PREVIEW_CACHE_CONTROL = "public, max-age=86400, immutable"
 
 
 @asynccontextmanager
@@ -30,9 +42,21 @@ async def lifespan(app: FastAPI):
     # Initialize database on startup
     database.init_db()
 
+    # One pooled HTTP client for all Ollama calls
+    app.state.http = llm.create_client()
+    llm.set_client(app.state.http)
+
+    # Keep the model loaded so the first search after idle doesn't pay the load time
+    async def _keep_warm():
+        while True:
+            await llm.warm_model()
+            await asyncio.sleep(KEEP_WARM_INTERVAL)
+
+    keep_warm_task = asyncio.create_task(_keep_warm())
+
     # Start file watcher
     from watcher import watcher
-    watcher.start()
+    watcher.start(loop=asyncio.get_running_loop())
 
     # Background thread: keep retrying ES connection until it succeeds.
     # This handles the common case where ES takes > 60s to start (Windows service
@@ -59,8 +83,14 @@ async def lifespan(app: FastAPI):
     # Stop watcher
     watcher.stop()
 
+    keep_warm_task.cancel()
+
+    llm.set_client(None)
+    await app.state.http.aclose()
 
-app = FastAPI(title="File Guessr", lifespan=lifespan)
+
+# orjson serializes the (large) search result lists much faster than stdlib json
+app = FastAPI(title="File Guessr", lifespan=lifespan, default_response_class=ORJSONResponse)
 
 # Serve static files
 app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
@@ -123,7 +153,8 @@ async def start_indexing(body: dict, background_tasks: BackgroundTasks):
     if not folder_path:
         return JSONResponse({"error": "folder_path is required"}, status_code=400)
 
-    if not os.path.isdir(folder_path):
+    # Filesystem checks run in a thread: on network drives they can stall for a while
+    if not await asyncio.to_thread(os.path.isdir, folder_path):
         return JSONResponse({"error": f"Folder not found: {folder_path}"}, status_code=400)
 
     status = get_index_status()
@@ -150,6 +181,13 @@ async def search(q: str = Query("")):
     return result
 
 
+def _save_temp_file(content: bytes, suffix: str) -> str:
+    """Write an upload to a temporary file and return its path."""
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
+        tmp.write(content)
+        return tmp.name
+
+
 @app.post("/api/search/multimodal")
 async def search_multimodal(
     file: UploadFile = File(...),
@@ -160,10 +198,8 @@ async def search_multimodal(
     try:
         # Save uploaded file temporarily
         suffix = os.path.splitext(file.filename or "")[1]
-        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-            content = await file.read()
-            tmp.write(content)
-            temp_path = tmp.name
+        content = await file.read()
+        temp_path = await asyncio.to_thread(_save_temp_file, content, suffix)
 
         # Determine how to process the file
         category = get_file_category(temp_path)
@@ -175,7 +211,7 @@ async def search_multimodal(
             image_path = temp_path
         else:
             # Parse text content from the file
-            text, _ = parse_file(temp_path)
+            text, _ = await asyncio.to_thread(parse_file, temp_path)
             file_content = text
 
         # LLM: combine text query + file to generate search keywords
@@ -184,11 +220,12 @@ async def search_multimodal(
             file_content=file_content,
             image_path=image_path,
         )
+        expanded_query = clean_search_terms(expanded_query) or q
         print(f"[MultiSearch] Query: '{q}' + File: '{file.filename}' → Keywords: '{expanded_query}'")
 
         # Search with expanded keywords
         from database import search as db_search
-        results = db_search(expanded_query, limit=20)
+        results, _ = await asyncio.to_thread(db_search, expanded_query, limit=20)
 
         return {
             "original_query": q,
@@ -203,9 +240,9 @@ async def search_multimodal(
         return JSONResponse({"error": str(e)}, status_code=500)
     finally:
         # Clean up temp file
-        if temp_path and os.path.exists(temp_path):
+        if temp_path:
             try:
-                os.unlink(temp_path)
+                await asyncio.to_thread(os.unlink, temp_path)
             except OSError:
                 pass
 
@@ -280,18 +317,22 @@ async def set_llm_model(body: dict):
 async def get_llm_logs():
     """Get the last N lines of the AI engine log."""
     from llm import ai_log_file
-    if not os.path.exists(ai_log_file):
+    if not await asyncio.to_thread(os.path.exists, ai_log_file):
         return {"logs": "Log file not found."}
     
     try:
-        with open(ai_log_file, "r", encoding="utf-8") as f:
-            # Get last 100 lines
-            lines = f.readlines()
-            return {"logs": "".join(lines[-100:])}
+        # Get last 100 lines
+        lines = await asyncio.to_thread(_read_lines, ai_log_file)
+        return {"logs": "".join(lines[-100:])}
     except Exception as e:
         return {"logs": f"Error reading logs: {e}"}
 
 
+def _read_lines(path: str) -> list[str]:
+    with open(path, "r", encoding="utf-8") as f:
+        return f.readlines()
+
+
 @app.post("/api/clear")
 async def clear_index():
     """Clear all indexed data and forcefully stop any active indexing."""
@@ -311,13 +352,39 @@ async def clear_index():
     return {"message": "Index cleared"}
 
 
+def _is_in_watched_folder(path: str) -> bool:
+    """Check that a path resolves to somewhere inside a watched folder."""
+    real = os.path.normcase(os.path.realpath(path))
+    for folder in database.get_watched_folders():
+        root = os.path.normcase(os.path.realpath(folder))
+        try:
+            if os.path.commonpath([real, root]) == root:
+                return True
+        except ValueError:
+            # Different drives on Windows
+            continue
+    return False
+
+
 @app.get("/api/file/preview")
-async def file_preview(path: str = Query(...)):
+async def file_preview(request: Request, path: str = Query(...)):
     """Serve a file for preview (mainly for images)."""
-    if not os.path.isfile(path):
+    # Only serve indexed locations, not arbitrary files on disk. Checked before
+    # the file exists, and with the same 404, so callers can't probe other paths.
+    if not await asyncio.to_thread(_is_in_watched_folder, path):
+        return JSONResponse({"error": "File not found"}, status_code=404)
+
+    if not await asyncio.to_thread(os.path.isfile, path):
         return JSONResponse({"error": "File not found"}, status_code=404)
 
-    return FileResponse(path)
+    st = await asyncio.to_thread(os.stat, path)
+    etag = f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+    headers = {"Cache-Control": PREVIEW_CACHE_CONTROL, "ETag": etag}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    media_type = EXT_MIME.get(get_file_ext(path), "application/octet-stream")
+    return FileResponse(path, media_type=media_type, headers=headers, stat_result=st)
 
 
 if __name__ == "__main__":
@@ -1,8 +1,53 @@
 """
 Searcher - Query expansion + Elasticsearch search.
 """
-from llm import expand_query
-from database import search as db_search
+import asyncio
+import re
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from llm import expand_query, normalize_query, get_model_name
+from database import search as db_search, get_index_version
+
+# Result cache: (model, normalized query, limit) -> (index version, expanded query, results).
+# Entries are valid only while the index version is unchanged.
+SEARCH_CACHE_MAX = 512
+# ES makes writes searchable after its 1s refresh interval; results fetched
+# sooner than that after a change may be stale, so they are not cached.
+ES_REFRESH_DELAY = 1.0
+_search_cache: "OrderedDict[tuple[str, str, int], tuple[int, str, list[dict]]]" = OrderedDict()
+
+# Words in any script, keeping inner . - ' (e.g. "3.5", "e-mail"); anything
+# else in LLM output (quotes, commas, bullets, markdown) is dropped
+_TOKEN_RE = re.compile(r"\w+(?:[.\-']\w+)*")
+# Every term becomes an ES clause / SQLite LIKE scan; a rambling expansion shouldn't
+MAX_SEARCH_TERMS = 32
+
+
+def clean_search_terms(text: str) -> str:
+    """Reduce LLM keyword output to at most MAX_SEARCH_TERMS distinct words, space-separated."""
+    terms = list(dict.fromkeys(_TOKEN_RE.findall(text)))
+    return " ".join(terms[:MAX_SEARCH_TERMS])
+
+
+def _get_cached_search(key: tuple[str, str, int], version: int) -> Optional[tuple[str, list[dict]]]:
+    entry = _search_cache.get(key)
+    if entry is None:
+        return None
+    cached_version, expanded_query, results = entry
+    if cached_version != version:
+        del _search_cache[key]
+        return None
+    _search_cache.move_to_end(key)
+    return expanded_query, results
+
+
+def _cache_search(key: tuple[str, str, int], version: int, expanded_query: str, results: list[dict]):
+    _search_cache[key] = (version, expanded_query, results)
+    _search_cache.move_to_end(key)
+    while len(_search_cache) > SEARCH_CACHE_MAX:
+        _search_cache.popitem(last=False)
 
 
 async def search_files(query: str, limit: int = 20) -> dict:
@@ -11,18 +56,44 @@ async def search_files(query: str, limit: int = 20) -> dict:
     1. Expand query with LLM (add synonyms, translate to English)
     2. Search Elasticsearch with expanded keywords
     3. Return ranked results
+    Results are cached until the index changes (see database.get_index_version).
     """
+    expanded_query = query
     try:
+        cache_key = (get_model_name().strip(), normalize_query(query), limit)
+        version, changed_at = get_index_version()
+        cached = _get_cached_search(cache_key, version)
+        if cached is not None:
+            expanded_query, results = cached
+            print(f"[Search] Cache hit for '{query}'")
+            return {
+                "original_query": query,
+                "expanded_query": expanded_query,
+                "total_results": len(results),
+                "results": results,
+            }
+
         if not query:
             print("[Search] Empty query, returning all files")
             expanded_query = ""
-            results = db_search(expanded_query, limit=limit)
+            results, degraded = await asyncio.to_thread(db_search, expanded_query, limit=limit)
+            cacheable = not degraded
         else:
             # Step 1: Expand query
-            expanded_query = await expand_query(query)
+            expanded = await expand_query(query)
+            # Expansion failed (Ollama down, model missing): search with the raw
+            # query, but don't cache results that would outlive Ollama coming back
+            cacheable = expanded is not None
+            expanded_query = clean_search_terms(expanded or query) or query
             print(f"[Search] Original: '{query}' → Expanded: '{expanded_query}'")
             # Step 2: Elasticsearch search
-            results = db_search(expanded_query, limit=limit)
+            results, degraded = await asyncio.to_thread(db_search, expanded_query, limit=limit)
+            # ES errored or the SQLite fallback answered: these results would
+            # outlive ES recovering, since a reconnect doesn't bump the version
+            cacheable = cacheable and not degraded
+
+        if cacheable and time.monotonic() - changed_at >= ES_REFRESH_DELAY:
+            _cache_search(cache_key, version, expanded_query, results)
 
         # Step 3: Format results
         return {
@@ -36,7 +107,7 @@ async def search_files(query: str, limit: int = 20) -> dict:
         # Return empty result instead of crashing
         return {
             "original_query": query,
-            "expanded_query": query,  # Fallback
+            "expanded_query": expanded_query,  # Original query if expansion didn't finish
             "total_results": 0,
             "results": [],
             "error": str(e)
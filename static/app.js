@@ -213,7 +213,7 @@ function renderResult(r, index, expandedQuery, originalQuery) {
     let imagePreview = '';
     if (isImage) {
         imagePreview = `<img class="result-image-preview" 
-            src="${API}/api/file/preview?path=${encodeURIComponent(r.file_path)}" 
+            src="${API}/api/file/preview?path=${encodeURIComponent(r.file_path)}&v=${r.modified_time || 0}" 
             alt="${escapeHtml(r.file_name)}"
             loading="lazy">`;
     }
@@ -297,9 +297,15 @@ async function updateProgress() {
     try {
         const res = await fetch(`${API}/api/index/status`);
         const data = await res.json();
-        const pct = data.total_files > 0 ? Math.round((data.processed_files / data.total_files) * 100) : 0;
-        document.getElementById('progress-bar').style.width = `${pct}%`;
-        document.getElementById('progress-text').textContent = `${data.processed_files} / ${data.total_files} (${pct}%)`;
+        // While the folder is still being scanned the total keeps growing, so no percentage yet
+        if (data.scanning) {
+            document.getElementById('progress-bar').style.width = '0%';
+            document.getElementById('progress-text').textContent = `${data.processed_files} / ${data.total_files}+ (掃描中...)`;
+        } else {
+            const pct = data.total_files > 0 ? Math.round((data.processed_files / data.total_files) * 100) : 0;
+            document.getElementById('progress-bar').style.width = `${pct}%`;
+            document.getElementById('progress-text').textContent = `${data.processed_files} / ${data.total_files} (${pct}%)`;
+        }
         document.getElementById('progress-file').textContent = data.current_file || '-';
         document.getElementById('progress-time').textContent = `耗時: ${data.elapsed_seconds}s`;
         if (data.errors && data.errors.length > 0) {
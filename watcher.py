@@ -10,15 +10,20 @@ from watchdog.events import FileSystemEventHandler
 import database
 from indexer import index_file
 
-# Debounce time in seconds
+# Debounce time in seconds: a file is indexed once it has been quiet this long
 DEBOUNCE_DELAY = 1.0
+# How often the drain task checks for files whose debounce has expired
+DRAIN_INTERVAL = 0.25
+# Max files indexed concurrently per watcher batch
+INDEX_BATCH_SIZE = 8
 
 
 class FileChangeHandler(FileSystemEventHandler):
     def __init__(self, loop):
         self.loop = loop
-        self.pending_files = {}
-        self.processing = False
+        # path -> monotonic deadline; repeated events for a path push it back.
+        # Only touched from the event loop thread, so no lock is needed.
+        self.pending: dict[str, float] = {}
 
     def on_created(self, event):
         if not event.is_directory:
@@ -48,18 +53,18 @@ class FileChangeHandler(FileSystemEventHandler):
     def _schedule_index(self, file_path: str):
         """Schedule file for indexing with debounce."""
         print(f"[Watcher] Change detected: {file_path}")
-        # Run indexing in the main loop
-        asyncio.run_coroutine_threadsafe(self._process_file(file_path), self.loop)
+        # Runs on the observer thread: hand the update to the loop
+        self.loop.call_soon_threadsafe(
+            self.pending.__setitem__, file_path, time.monotonic() + DEBOUNCE_DELAY
+        )
 
-    async def _process_file(self, file_path: str):
-        # Small delay to let file write finish
-        await asyncio.sleep(1.0)
-        try:
-            if os.path.exists(file_path):
-                print(f"[Watcher] Indexing: {file_path}")
-                await index_file(file_path)
-        except Exception as e:
-            print(f"[Watcher] Error processing {file_path}: {e}")
+    def pop_ready(self, limit: int) -> list[str]:
+        """Remove and return up to `limit` paths whose debounce has expired."""
+        now = time.monotonic()
+        ready = [p for p, deadline in self.pending.items() if deadline <= now][:limit]
+        for p in ready:
+            del self.pending[p]
+        return ready
 
 
 class WatcherManager:
@@ -68,11 +73,13 @@ class WatcherManager:
         self.watched_paths = set()
         self.handler = None
         self._loop = None
+        self._drainer = None
 
-    def start(self):
-        """Start watching all folders in DB."""
-        self._loop = asyncio.get_event_loop()
+    def start(self, loop: asyncio.AbstractEventLoop):
+        """Start watching all folders in DB. `loop` is the app's running event loop."""
+        self._loop = loop
         self.handler = FileChangeHandler(self._loop)
+        self._drainer = self._loop.create_task(self._drain())
         
         # Load existing folders
         folders = database.get_watched_folders()
@@ -85,6 +92,24 @@ class WatcherManager:
     def stop(self):
         self.observer.stop()
         self.observer.join()
+        if self._drainer:
+            self._drainer.cancel()
+
+    async def _drain(self):
+        """Index debounced changes, a batch of files concurrently at a time."""
+        while True:
+            await asyncio.sleep(DRAIN_INTERVAL)
+            batch = self.handler.pop_ready(INDEX_BATCH_SIZE)
+            if batch:
+                await asyncio.gather(*(self._process_file(p) for p in batch))
+
+    async def _process_file(self, file_path: str):
+        try:
+            if os.path.exists(file_path):
+                print(f"[Watcher] Indexing: {file_path}")
+                await index_file(file_path)
+        except Exception as e:
+            print(f"[Watcher] Error processing {file_path}: {e}")
 
     def add_watch(self, folder_path: str):
         """Add a folder to watch if not already watched."""